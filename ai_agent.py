@@ -2,6 +2,7 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import create_react_agent
 from dotenv import load_dotenv
 from tools import analyze_image_with_query
+from scheduler import scheduler
 
 load_dotenv()
 
@@ -15,10 +16,63 @@ Rules:
 4. Never use the webcam “just in case.”
 5. When tool results are used, present them naturally and with charm as Lavendar.
 """
+
+llm_model = "gemini-2.0-flash"
+
+def _tokens_used(result) -> int:
+    """Returns the total tokens Gemini reported for one model call (0 if unknown)."""
+    message = result.generations[0].message
+    return (getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0)
+
+class ScheduledChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    Sends every Gemini call through the shared scheduler, so an agent turn that
+    uses a tool is charged (and retried on 429) one model call at a time.
+
+    Only sync invocation (invoke and stream) is scheduled. The async paths
+    (ainvoke, astream) bypass the scheduler and keep the SDK's own retries.
+    """
+    def _estimate(self, messages) -> int:
+        return sum(len(str(message.content)) for message in messages) // 4
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._generate
+        estimate = self._estimate(messages)
+        # The SDK ignores the constructor's max_retries here and reads it per call;
+        # one attempt leaves 429 handling to the scheduler
+        return scheduler.submit(
+            "gemini",
+            llm_model,
+            lambda: generate(messages, stop=stop, run_manager=run_manager, max_retries=1, **kwargs),
+            tokens=estimate,
+            max_wait=30,
+            usage=lambda result: _tokens_used(result) or estimate
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        stream = super()._stream
+
+        # The request is only sent when the first chunk is pulled, so do that
+        # inside the scheduled call to let a 429 surface (and be retried) there
+        def start_stream():
+            chunks = stream(messages, stop=stop, run_manager=run_manager, max_retries=1, **kwargs)
+            return chunks, next(chunks, None)
+
+        chunks, first = scheduler.submit(
+            "gemini",
+            llm_model,
+            start_stream,
+            tokens=self._estimate(messages),
+            max_wait=30
+        )
+        if first is not None:
+            yield first
+            yield from chunks
+
 # Initialize the language model
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
+llm = ScheduledChatGoogleGenerativeAI(
+    model=llm_model,
     temperature=0.7,
 )
 # Function to ask the agent a question
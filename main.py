@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 from speech_to_text import record_audio, transcribe_with_groq
 from text_to_speech import text_to_speech_with_elevenlabs
 from ai_agent import ask_agent
+from scheduler import Backpressure, scheduler
 
 load_dotenv()
 
@@ -65,6 +66,13 @@ def process_audio_and_chat():
                     time.sleep(0.5)
                     continue
                     
+            except Backpressure as e:
+                busy_msg = f"⏳ Speech service is busy, listening again in {e.retry_after:.0f}s..."
+                print(busy_msg)
+                chat_history.append(["🟡 System", busy_msg])
+                yield chat_history
+                time.sleep(min(e.retry_after, 10))
+                continue
             except Exception as e:
                 error_msg = f"Transcription error: {e}"
                 print(error_msg)
@@ -91,6 +99,7 @@ def process_audio_and_chat():
                 except Exception as e:
                     print(f"TTS farewell error: {e}")
                 
+                print(f"📊 Scheduler metrics: {scheduler.metrics()}")
                 break
             
             print("🤖 Getting AI response...")
@@ -102,6 +111,9 @@ def process_audio_and_chat():
                 if not response or response.strip() == "":
                     response = "I'm sorry, I couldn't process your request. Could you try again?"
                     
+            except Backpressure as e:
+                response = f"I'm a little overloaded right now. Give me about {e.retry_after:.0f} seconds and ask again!"
+                print(f"AI Agent backpressure: {e}")
             except Exception as e:
                 response = f"I encountered an error: {e}. Please try again."
                 print(f"AI Agent error: {e}")
@@ -121,6 +133,8 @@ def process_audio_and_chat():
                     input_text=response, 
                     output_filepath=str(response_audio_path)
                 )
+            except Backpressure as e:
+                print(f"TTS skipped, voice service busy: {e}")
             except Exception as e:
                 print(f"TTS error: {e}")
                 # Continue without TTS if it fails
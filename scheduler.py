@@ -0,0 +1,292 @@
+import logging
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+# Priority classes - lower value is served first.
+# Interactive turns (the user is waiting) always jump ahead of background work
+# such as summaries, prefetch or batch jobs queued against the same provider.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Default limits per (provider, model): requests per minute and tokens per minute.
+# None means the dimension is not limited. For ElevenLabs "tokens" are characters.
+DEFAULT_LIMITS = {
+    ("groq", "whisper-large-v3"): {"rpm": 20, "tpm": None},
+    ("groq", "meta-llama/llama-4-maverick-17b-128e-instruct"): {"rpm": 30, "tpm": 6000},
+    ("gemini", "gemini-2.0-flash"): {"rpm": 15, "tpm": 1000000},
+    ("elevenlabs", "eleven_multilingual_v2"): {"rpm": 60, "tpm": None},
+}
+FALLBACK_LIMITS = {"rpm": 30, "tpm": None}
+
+
+class Backpressure(Exception):
+    """
+    Raised instead of a provider failure when a request cannot be served in time.
+    Carries how long the caller should wait before trying again (in seconds).
+    """
+    def __init__(self, provider, model, retry_after, reason):
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"{provider}/{model} is busy ({reason}), retry in {retry_after:.1f}s")
+
+
+class TokenBucket:
+    """Refills continuously up to `capacity` units per minute."""
+    def __init__(self, per_minute, clock):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) the difference once actual usage is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Lane:
+    """Queue, buckets, Retry-After block and metrics for one (provider, model)."""
+    def __init__(self, limits, clock):
+        self.requests = TokenBucket(limits["rpm"], clock) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"], clock) if limits.get("tpm") else None
+        self.blocked_until = 0.0
+        self.queue = []  # heap of (priority, seq)
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "throttled": 0,      # had to wait on a local bucket or Retry-After
+            "rate_limited": 0,   # provider answered 429
+            "backpressure": 0,   # caller got a Backpressure signal
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+        self.recent_waits = deque(maxlen=200)
+
+    def wait_time(self, tokens, now):
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def record_wait(self, waited):
+        self.metrics["wait_total"] += waited
+        self.metrics["wait_max"] = max(self.metrics["wait_max"], waited)
+        self.recent_waits.append(waited)
+
+    def take(self, tokens):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and tokens:
+            self.tokens.take(tokens)
+
+
+def _rate_limit_info(exc):
+    """
+    Returns (is_rate_limited, retry_after_seconds or None) for an SDK exception.
+    Works with the Groq/httpx, ElevenLabs and Google API error shapes.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status is None:
+        code = getattr(exc, "code", None)
+        status = code if isinstance(code, int) else None
+    if status != 429 and type(exc).__name__ not in ("RateLimitError", "ResourceExhausted"):
+        return False, None
+
+    headers = getattr(exc, "headers", None) or getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return True, None
+    try:
+        return True, max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            # HTTP dates are always GMT; a naive datetime would be read as local time
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return True, max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return True, None
+
+
+class RequestScheduler:
+    """
+    Central scheduler for outbound provider calls (Groq, Gemini, ElevenLabs).
+    Each (provider, model) gets its own token buckets and priority queue so
+    that one busy model never blocks another.
+    """
+    def __init__(self, limits=None, clock=time.monotonic, max_retries=3, max_queue=32):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.clock = clock
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self._lanes = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def configure(self, provider, model, rpm=None, tpm=None):
+        """Override the limits for one provider/model (resets its buckets)."""
+        with self._cond:
+            self.limits[(provider, model)] = {"rpm": rpm, "tpm": tpm}
+            lane = self._lanes.get((provider, model))
+            if lane is not None:
+                lane.requests = TokenBucket(rpm, self.clock) if rpm else None
+                lane.tokens = TokenBucket(tpm, self.clock) if tpm else None
+            self._cond.notify_all()
+
+    def _lane(self, provider, model):
+        key = (provider, model)
+        if key not in self._lanes:
+            self._lanes[key] = _Lane(self.limits.get(key, FALLBACK_LIMITS), self.clock)
+        return self._lanes[key]
+
+    def _acquire(self, lane, ticket, tokens, deadline, provider, model):
+        """Blocks until `ticket` is at the head of its lane and capacity is free."""
+        throttled = False
+        while True:
+            now = self.clock()
+            if lane.queue[0] == ticket:
+                wait = lane.wait_time(tokens, now)
+                if wait <= 0:
+                    heapq.heappop(lane.queue)
+                    lane.take(tokens)
+                    self._cond.notify_all()
+                    return
+                if not throttled:
+                    throttled = True
+                    lane.metrics["throttled"] += 1
+                    logging.info(f"Throttling {provider}/{model} for {wait:.2f}s")
+            else:
+                wait = None
+
+            if deadline is not None and (now >= deadline or (wait is not None and now + wait > deadline)):
+                lane.metrics["backpressure"] += 1
+                retry_after = wait if wait is not None else lane.wait_time(tokens, now)
+                raise Backpressure(provider, model, retry_after, "queue wait exceeded")
+
+            timeout = wait
+            if deadline is not None:
+                timeout = min(timeout, deadline - now) if timeout is not None else deadline - now
+            self._cond.wait(timeout=timeout)
+
+    def submit(self, provider, model, fn, priority=INTERACTIVE, tokens=0, max_wait=None, usage=None):
+        """
+        Runs `fn()` once the provider/model has capacity and returns its result.
+
+        Args:
+        provider (str): Provider name, e.g. "groq".
+        model (str): Model name the limits are tracked under.
+        fn (callable): Zero-argument function performing the API call.
+        priority (int): INTERACTIVE or BACKGROUND.
+        tokens (int): Estimated tokens (or characters) the call will consume.
+        max_wait (float): Longest the caller will queue, in seconds; None waits forever.
+        usage (callable): Optional function mapping the result to actual tokens used.
+
+        Raises Backpressure when the call cannot be served within `max_wait`,
+        when a background queue is full, or when the provider keeps answering 429.
+        """
+        start = self.clock()
+        deadline = None if max_wait is None else start + max_wait
+
+        with self._cond:
+            lane = self._lane(provider, model)
+            lane.metrics["submitted"] += 1
+            if priority != INTERACTIVE and len(lane.queue) >= self.max_queue:
+                lane.metrics["backpressure"] += 1
+                raise Backpressure(provider, model, lane.wait_time(tokens, start), "queue full")
+            ticket = (priority, next(self._seq))
+
+        attempt = 0
+        while True:
+            with self._cond:
+                queued_at = self.clock()
+                heapq.heappush(lane.queue, ticket)
+                try:
+                    self._acquire(lane, ticket, tokens, deadline, provider, model)
+                except BaseException:
+                    # Backpressure, KeyboardInterrupt... never leave an orphan ticket at the head
+                    if ticket in lane.queue:
+                        lane.queue.remove(ticket)
+                        heapq.heapify(lane.queue)
+                        self._cond.notify_all()
+                    raise
+                finally:
+                    # Every queue wait counts, including retries and ones that ended in Backpressure
+                    lane.record_wait(self.clock() - queued_at)
+
+            try:
+                result = fn()
+            except Exception as e:
+                limited, retry_after = _rate_limit_info(e)
+                if not limited:
+                    raise
+                attempt += 1
+                if retry_after is None:
+                    retry_after = float(2 ** attempt)
+                with self._cond:
+                    lane.metrics["rate_limited"] += 1
+                    lane.blocked_until = max(lane.blocked_until, self.clock() + retry_after)
+                    logging.warning(f"{provider}/{model} rate limited, retrying after {retry_after:.1f}s")
+                    if attempt > self.max_retries:
+                        lane.metrics["backpressure"] += 1
+                        raise Backpressure(provider, model, retry_after, "rate limited") from e
+                continue
+
+            with self._cond:
+                lane.metrics["completed"] += 1
+                if usage is not None and lane.tokens:
+                    try:
+                        lane.tokens.adjust(usage(result) - tokens)
+                    except Exception as e:
+                        logging.error(f"Could not read usage for {provider}/{model}: {e}")
+            return result
+
+    def metrics(self):
+        """
+        Snapshot of counters and queue wait times per 'provider/model'.
+        Every queue wait is a sample, including retries and waits that ended in
+        Backpressure; wait_avg and wait_p95 cover the most recent 200 of them.
+        """
+        with self._cond:
+            snapshot = {}
+            for (provider, model), lane in self._lanes.items():
+                stats = dict(lane.metrics)
+                waits = sorted(lane.recent_waits)
+                stats["queued"] = len(lane.queue)
+                stats["wait_avg"] = sum(waits) / len(waits) if waits else 0.0
+                stats["wait_p95"] = waits[int(0.95 * (len(waits) - 1))] if waits else 0.0
+                snapshot[f"{provider}/{model}"] = stats
+            return snapshot
+
+
+# Shared scheduler used by every module that talks to a provider.
+scheduler = RequestScheduler()
@@ -5,6 +5,7 @@ from io import BytesIO
 import os
 from groq import Groq
 from dotenv import load_dotenv
+from scheduler import scheduler
 load_dotenv()
 
 # Configures logging to show time, level (INFO/ERROR), and message.
@@ -47,14 +48,20 @@ def record_audio(file_path, timeout=20, phrase_time_limit=None):
 
 def transcribe_with_groq(audio_filepath):
    GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-   client = Groq(api_key=GROQ_API_KEY)
+   # SDK retries are off: the scheduler is the only layer that retries on 429
+   client = Groq(api_key=GROQ_API_KEY, max_retries=0)
    stt_model = "whisper-large-v3"
-   audio_file=open(audio_filepath, "rb")
-   transcription = client.audio.transcriptions.create(
-       model=stt_model,
-       file=audio_file,
-       language="en"
-   )
+
+   # Reopen the file on every attempt so a retried request re-sends it from the start
+   def create_transcription():
+       with open(audio_filepath, "rb") as audio_file:
+           return client.audio.transcriptions.create(
+               model=stt_model,
+               file=audio_file,
+               language="en"
+           )
+
+   transcription = scheduler.submit("groq", stt_model, create_transcription, max_wait=30)
    return transcription.text
 
 # audio_filepath = "testing_stt.mp3"
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+pytest.importorskip("langgraph")
+pytest.importorskip("cv2")
+pytest.importorskip("groq")
+
+from google.api_core.exceptions import ResourceExhausted
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+import ai_agent
+from scheduler import Backpressure, RequestScheduler
+from test_scheduler import FakeClock, FakeCondition
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Gemini client whose every request answers 429, plus the scheduler it goes through."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(
+        limits={("gemini", ai_agent.llm_model): {"rpm": None, "tpm": None}},
+        clock=clock,
+        max_retries=2,
+    )
+    scheduler._cond = FakeCondition(clock)
+    monkeypatch.setattr(ai_agent, "scheduler", scheduler)
+
+    calls = []
+    def resource_exhausted(*args, **kwargs):
+        calls.append(clock())
+        raise ResourceExhausted("Quota exceeded")
+    monkeypatch.setattr(ai_agent.llm.client, "generate_content", resource_exhausted)
+    monkeypatch.setattr(ai_agent.llm.client, "stream_generate_content", resource_exhausted)
+    return scheduler, calls
+
+
+def test_resource_exhausted_reaches_scheduler_on_first_attempt(gemini):
+    scheduler, calls = gemini
+
+    with pytest.raises(Backpressure):
+        ai_agent.llm.invoke("hello")
+
+    # One upstream request per scheduler attempt: the SDK itself never retries
+    assert len(calls) == 3
+    assert scheduler.metrics()[f"gemini/{ai_agent.llm_model}"]["rate_limited"] == 3
+
+
+def test_streamed_calls_go_through_scheduler(gemini):
+    scheduler, calls = gemini
+
+    with pytest.raises(Backpressure):
+        list(ai_agent.llm.stream("hello"))
+
+    assert len(calls) == 3
+    assert scheduler.metrics()[f"gemini/{ai_agent.llm_model}"]["rate_limited"] == 3
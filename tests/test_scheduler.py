@@ -0,0 +1,291 @@
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from scheduler import BACKGROUND, INTERACTIVE, Backpressure, RequestScheduler
+
+
+class FakeClock:
+    """Monotonic clock the tests move forward by hand."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeCondition(threading.Condition):
+    """
+    Condition whose timed waits jump the fake clock forward instead of sleeping,
+    so single-threaded tests run instantly. With auto_advance off, waits poll
+    briefly in real time and the test decides when time passes.
+    """
+    def __init__(self, clock, auto_advance=True):
+        super().__init__()
+        self.clock = clock
+        self.auto_advance = auto_advance
+
+    def wait(self, timeout=None):
+        if self.auto_advance and timeout is not None:
+            self.clock.advance(timeout)
+            return True
+        return super().wait(0.01)
+
+
+class StubRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("429 Too Many Requests")
+        self.headers = headers
+
+
+class StubProvider:
+    """Local stand-in for an API that enforces its own requests-per-minute limit."""
+    def __init__(self, clock, rpm, headers=None):
+        self.clock = clock
+        self.rpm = rpm
+        self.headers = {"retry-after": "10"} if headers is None else headers
+        self.accepted = []
+        self.rejected = []
+
+    def call(self):
+        now = self.clock()
+        recent = [t for t in self.accepted if now - t < 60]
+        if len(recent) >= self.rpm:
+            self.rejected.append(now)
+            raise StubRateLimitError(self.headers)
+        self.accepted.append(now)
+        return "ok"
+
+
+def make_scheduler(clock, rpm=None, tpm=None, auto_advance=True, **kwargs):
+    scheduler = RequestScheduler(limits={("stub", "model"): {"rpm": rpm, "tpm": tpm}}, clock=clock, **kwargs)
+    scheduler._cond = FakeCondition(clock, auto_advance)
+    return scheduler
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting for the scheduler"
+        time.sleep(0.005)
+
+
+def test_retry_after_blocks_lane_until_it_expires():
+    clock = FakeClock()
+    stub = StubProvider(clock, rpm=1, headers={"retry-after": "60"})
+    scheduler = make_scheduler(clock)
+
+    assert scheduler.submit("stub", "model", stub.call) == "ok"
+    assert scheduler.submit("stub", "model", stub.call) == "ok"
+
+    # The stub rejected once at t=0, then accepted the retry once retry-after passed
+    assert stub.rejected == [0.0]
+    assert stub.accepted == [0.0, 60.0]
+    metrics = scheduler.metrics()["stub/model"]
+    assert metrics["rate_limited"] == 1
+    # The retry's 60s queue wait is part of the wait metrics
+    assert metrics["wait_max"] == pytest.approx(60.0)
+
+
+def test_retry_after_blocks_other_callers():
+    clock = FakeClock()
+    stub = StubProvider(clock, rpm=1, headers={"retry-after": "10"})
+    scheduler = make_scheduler(clock, max_retries=0)
+    scheduler.submit("stub", "model", stub.call)
+
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", stub.call)
+    assert error.value.reason == "rate limited"
+
+    # The lane stays blocked for the whole Retry-After window
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", lambda: "ok", max_wait=5)
+    assert error.value.retry_after == pytest.approx(10.0)
+
+    clock.advance(10)
+    assert scheduler.submit("stub", "model", lambda: "ok", max_wait=0) == "ok"
+
+
+def test_retry_after_http_date():
+    clock = FakeClock()
+    retry_at = formatdate(time.time() + 120, usegmt=True)
+    stub = StubProvider(clock, rpm=1, headers={"retry-after": retry_at})
+    scheduler = make_scheduler(clock, max_retries=0)
+    scheduler.submit("stub", "model", stub.call)
+
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", stub.call)
+    assert error.value.retry_after == pytest.approx(120, abs=2)
+
+
+def test_retry_after_http_date_without_timezone_is_utc():
+    clock = FakeClock()
+    retry_at = formatdate(time.time() + 120, usegmt=True).replace(" GMT", "")
+    stub = StubProvider(clock, rpm=1, headers={"retry-after": retry_at})
+    scheduler = make_scheduler(clock, max_retries=0)
+    scheduler.submit("stub", "model", stub.call)
+
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", stub.call)
+    assert error.value.retry_after == pytest.approx(120, abs=2)
+
+
+def test_exponential_backoff_without_retry_after():
+    clock = FakeClock()
+    stub = StubProvider(clock, rpm=0, headers={})
+    scheduler = make_scheduler(clock, max_retries=3)
+
+    with pytest.raises(Backpressure):
+        scheduler.submit("stub", "model", stub.call)
+
+    # Retries wait 2, 4 and 8 seconds after each 429
+    assert stub.rejected == [0.0, 2.0, 6.0, 14.0]
+
+
+def test_backpressure_after_max_retries():
+    clock = FakeClock()
+    stub = StubProvider(clock, rpm=0)
+    scheduler = make_scheduler(clock, max_retries=2)
+
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", stub.call)
+
+    assert error.value.reason == "rate limited"
+    assert error.value.retry_after == 10.0
+    assert len(stub.rejected) == 3
+    metrics = scheduler.metrics()["stub/model"]
+    assert metrics["rate_limited"] == 3
+    assert metrics["backpressure"] == 1
+    assert metrics["queued"] == 0
+
+
+def test_interactive_preempts_queued_background():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1, auto_advance=False)
+    scheduler.submit("stub", "model", lambda: None)
+    lane = scheduler._lanes[("stub", "model")]
+
+    order = []
+    def run(priority, name):
+        scheduler.submit("stub", "model", lambda: order.append(name), priority=priority)
+
+    threads = []
+    for priority, name in [(BACKGROUND, "bg1"), (BACKGROUND, "bg2"), (INTERACTIVE, "interactive")]:
+        thread = threading.Thread(target=run, args=(priority, name))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: len(lane.queue) == len(threads))
+
+    for served in range(1, 4):
+        with scheduler._cond:
+            clock.advance(60)
+        wait_for(lambda: len(order) == served)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactive", "bg1", "bg2"]
+
+
+def test_background_queue_cap():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1, auto_advance=False, max_queue=1)
+    scheduler.submit("stub", "model", lambda: None)
+    lane = scheduler._lanes[("stub", "model")]
+
+    thread = threading.Thread(target=scheduler.submit, args=("stub", "model", lambda: None, BACKGROUND))
+    thread.start()
+    wait_for(lambda: len(lane.queue) == 1)
+
+    with pytest.raises(Backpressure) as error:
+        scheduler.submit("stub", "model", lambda: None, priority=BACKGROUND)
+    assert error.value.reason == "queue full"
+
+    with scheduler._cond:
+        clock.advance(60)
+    thread.join()
+
+
+def test_interrupted_wait_does_not_orphan_ticket():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1)
+    scheduler.submit("stub", "model", lambda: None)
+
+    def interrupt(timeout=None):
+        raise KeyboardInterrupt
+    scheduler._cond.wait = interrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.submit("stub", "model", lambda: None)
+    assert scheduler._lanes[("stub", "model")].queue == []
+
+
+def test_metrics_counters():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=60, tpm=1200)
+
+    for _ in range(3):
+        scheduler.submit("stub", "model", lambda: None, tokens=600)
+    with pytest.raises(Backpressure):
+        scheduler.submit("stub", "model", lambda: None, tokens=600, max_wait=1)
+
+    metrics = scheduler.metrics()["stub/model"]
+    assert metrics["submitted"] == 4
+    assert metrics["completed"] == 3
+    assert metrics["throttled"] == 2
+    assert metrics["backpressure"] == 1
+    assert metrics["rate_limited"] == 0
+    assert metrics["queued"] == 0
+    # The third call waited 30s for the token bucket (600 tokens at 20/s);
+    # the rejected fourth call is still a (zero) wait sample
+    assert metrics["wait_max"] == pytest.approx(30.0)
+    assert metrics["wait_total"] == pytest.approx(30.0)
+    assert metrics["wait_avg"] == pytest.approx(7.5)
+
+
+def test_wait_ending_in_backpressure_is_recorded():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1, auto_advance=False)
+    scheduler.submit("stub", "model", lambda: None)
+    lane = scheduler._lanes[("stub", "model")]
+
+    head = threading.Thread(target=scheduler.submit, args=("stub", "model", lambda: None))
+    head.start()
+    wait_for(lambda: len(lane.queue) == 1)
+
+    errors = []
+    def impatient():
+        try:
+            scheduler.submit("stub", "model", lambda: None, max_wait=5)
+        except Backpressure as error:
+            errors.append(error)
+    behind = threading.Thread(target=impatient)
+    behind.start()
+    wait_for(lambda: len(lane.queue) == 2)
+
+    with scheduler._cond:
+        clock.advance(5)
+    behind.join()
+    assert len(errors) == 1
+    assert scheduler.metrics()["stub/model"]["wait_max"] == pytest.approx(5.0)
+
+    with scheduler._cond:
+        clock.advance(60)
+    head.join()
+
+
+def test_usage_reconciles_token_bucket():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, tpm=1200)
+
+    scheduler.submit("stub", "model", lambda: 1200, tokens=100, usage=lambda used: used)
+
+    # Actual usage drained the bucket, so the next call has to wait for a refill
+    with pytest.raises(Backpressure):
+        scheduler.submit("stub", "model", lambda: None, tokens=100, max_wait=1)
@@ -4,6 +4,7 @@ from elevenlabs.client import ElevenLabs
 import subprocess # to handle audio playback across different OS
 import platform # to determine the OS type
 from dotenv import load_dotenv
+from scheduler import scheduler
 
 load_dotenv()
 ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
@@ -19,17 +20,28 @@ def text_to_speech_with_elevenlabs(input_text, output_filepath):
     """
     client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
     
-    audio = client.text_to_speech.convert(
-        text=input_text,
-        voice_id="jqcCZkN6Knx8BJ5TBdYR",
-        model_id="eleven_multilingual_v2",
-        output_format="mp3_22050_32"
+    tts_model = "eleven_multilingual_v2"
+    
+    # convert() streams lazily, so join the chunks inside the scheduled call
+    # to make sure rate-limit errors surface (and are retried) there
+    audio = scheduler.submit(
+        "elevenlabs",
+        tts_model,
+        lambda: b"".join(client.text_to_speech.convert(
+            text=input_text,
+            voice_id="jqcCZkN6Knx8BJ5TBdYR",
+            model_id=tts_model,
+            output_format="mp3_22050_32",
+            # SDK retries are off: the scheduler is the only layer that retries on 429
+            request_options={"max_retries": 0}
+        )),
+        tokens=len(input_text),
+        max_wait=30
     )
     
     # Save the audio data to file - audio is already bytes data
     with open(output_filepath, 'wb') as f:
-        for chunk in audio:
-            f.write(chunk)
+        f.write(audio)
     
     print(f"Audio saved to: {output_filepath}")
     
@@ -25,6 +25,11 @@ def capture_image() -> str:
     raise RuntimeError("No camera found or unable to capture image.")
 
 from groq import Groq
+from scheduler import scheduler
+
+# Rough token cost of one webcam frame for the vision model's per-minute budget
+IMAGE_TOKEN_ESTIMATE = 1500
+
 def analyze_image_with_query(query: str) -> str:
     """
     Expects a string with 'query'.
@@ -37,7 +42,8 @@ def analyze_image_with_query(query: str) -> str:
     if not query or not img_b64:
         return "Error: both query and image are required."
     
-    client = Groq()
+    # SDK retries are off: the scheduler is the only layer that retries on 429
+    client = Groq(max_retries=0)
     messages = [
         {
             "role": "user",
@@ -55,9 +61,16 @@ def analyze_image_with_query(query: str) -> str:
             ],
         }
     ]
-    chat_completion = client.chat.completions.create(
-        messages = messages,
-        model = model
+    chat_completion = scheduler.submit(
+        "groq",
+        model,
+        lambda: client.chat.completions.create(
+            messages = messages,
+            model = model
+        ),
+        tokens = len(query) // 4 + IMAGE_TOKEN_ESTIMATE,
+        max_wait = 30,
+        usage = lambda completion: completion.usage.total_tokens
     )
     return chat_completion.choices[0].message.content
 